@@ -1,21 +1,26 @@
 import inspect
 import warnings
+import weakref
 from abc import abstractmethod
-import copy
+from operator import itemgetter
 import torch
-from typing import Sequence, Union, Dict, List
+from typing import Sequence, Union, Dict, List, Tuple, Any, Callable, Optional
 from xitorch._utils.exceptions import GetSetParamsError
 from xitorch._utils.attr import get_attr, set_attr
 
 __all__ = ["EditableModule"]
 
-torch_float_type = [torch.float32, torch.float, torch.float64, torch.float16]
+# torch.float is the same dtype as torch.float32
+_TORCH_FLOAT_TYPES = frozenset([torch.float32, torch.float64, torch.float16])
 
 class EditableModule(object):
     """
     ``EditableModule`` is a base class to enable classes that it inherits be
     converted to pure functions for higher order derivatives purpose.
     """
+    # per-instance caches of the unique parameters, created on the first call
+    # of _get_unique_params_idxs (subclasses do not need to call __init__)
+    _unique_params_idxs = None  # type: Union[Dict[str, List[int]], None]
 
     def getparams(self, methodname: str) -> Sequence[torch.Tensor]:
         # Returns a list of tensor parameters used in the object's operations
@@ -86,28 +91,28 @@ class EditableModule(object):
     def getuniqueparams(self, methodname: str) -> List[torch.Tensor]:
         allparams = self.getparams(methodname)
         idxs = self._get_unique_params_idxs(methodname, allparams)
-        return [allparams[i] for i in idxs]
+        getter = self._unique_params_getter[methodname]
+        if getter is None:
+            return []
+        res = getter(allparams)
+        # itemgetter with a single index returns the element, not a tuple
+        return [res] if len(idxs) == 1 else list(res)
 
     def setuniqueparams(self, methodname: str, *uniqueparams) -> int:
         nparams = self._number_of_params[methodname]
-        allparams = [None for _ in range(nparams)]
-        maps = self._unique_params_maps[methodname]
-
-        for j in range(len(uniqueparams)):
-            jmap = maps[j]
-            p = uniqueparams[j]
-            for i in jmap:
-                allparams[i] = p
-
+        allparams = [None] * nparams  # type: List
+        for j, i in self._unique_params_flat[methodname]:
+            allparams[i] = uniqueparams[j]
         return self.setparams(methodname, *allparams)
 
     def _get_unique_params_idxs(self, methodname: str,
                                 allparams: Union[Sequence[torch.Tensor], None] = None) -> Sequence[int]:
 
-        if not hasattr(self, "_unique_params_idxs"):
-            self._unique_params_idxs = {}  # type: Dict[str,Sequence[int]]
-            self._unique_params_maps = {}
+        if self._unique_params_idxs is None:
+            self._unique_params_idxs = {}
             self._number_of_params = {}
+            self._unique_params_flat = {}  # type: Dict[str, List[Tuple[int, int]]]
+            self._unique_params_getter = {}  # type: Dict[str, Optional[itemgetter]]
 
         if methodname in self._unique_params_idxs:
             return self._unique_params_idxs[methodname]
@@ -115,28 +120,24 @@ class EditableModule(object):
             allparams = self.getparams(methodname)
 
         # get the unique ids
-        ids = []  # type: List[int]
-        idxs = []
-        idx_map = []  # type: List[List[int]]
-        for i in range(len(allparams)):
-            param = allparams[i]
-            id_param = id(param)
-
+        id_to_slot = {}  # type: Dict[int, int]
+        idxs = []  # type: List[int]
+        # (index in the unique params, index in all params) pairs
+        flat = []  # type: List[Tuple[int, int]]
+        for i, param in enumerate(allparams):
             # search the id if it has been added to the list
-            try:
-                jfound = ids.index(id_param)
-                idx_map[jfound].append(i)
-                continue
-            except ValueError:
-                pass
-
-            ids.append(id_param)
-            idxs.append(i)
-            idx_map.append([i])
+            slot = id_to_slot.get(id(param))
+            if slot is None:
+                slot = len(idxs)
+                id_to_slot[id(param)] = slot
+                idxs.append(i)
+            flat.append((slot, i))
 
         self._number_of_params[methodname] = len(allparams)
         self._unique_params_idxs[methodname] = idxs
-        self._unique_params_maps[methodname] = idx_map
+        self._unique_params_flat[methodname] = flat
+        # itemgetter (unlike a lambda) keeps the object picklable
+        self._unique_params_getter[methodname] = itemgetter(*idxs) if len(idxs) > 0 else None
         return idxs
 
     ############# debugging #############
@@ -209,63 +210,45 @@ class EditableModule(object):
         # this method assert if method does not change the float tensor parameters
         # of the object (i.e. it preserves the state of the object)
 
+        # keep the signatures of the tensors instead of cloning them
         all_params0, names0 = _get_tensors(self)
-        all_params0 = [p.clone() for p in all_params0]
+        sigs0 = [_tensor_signature(p) for p in all_params0]
         method(*args, **kwargs)
         all_params1, names1 = _get_tensors(self)
 
         # now assert if all_params0 == all_params1
-        clsname = method.__self__.__class__.__name__
-        methodname = method.__name__
-        msg = "The method %s.%s does not preserve the object's float tensors" % (clsname, methodname)
-        if len(all_params0) != len(all_params1):
+        preserved = len(all_params0) == len(all_params1) and \
+            all(_is_preserved(p0, sig0, p1) for p0, sig0, p1 in zip(all_params0, sigs0, all_params1))
+        if not preserved:
+            clsname = type(method.__self__).__name__
+            msg = "The method %s.%s does not preserve the object's float tensors" % (clsname, method.__name__)
             raise GetSetParamsError(msg)
 
-        for p0, p1 in zip(all_params0, all_params1):
-            if p0.shape != p1.shape:
-                raise GetSetParamsError(msg)
-            if not torch.allclose(p0, p1):
-                raise GetSetParamsError(msg)
-
     def __assert_get_correct_params(self, method, *args, **kwargs):
         # this function perform checks if the getparams on the method returns
         # the correct tensors
 
         methodname = method.__name__
-        clsname = method.__self__.__class__.__name__
-
-        # get all tensor parameters in the object
-        all_params, all_names = _get_tensors(self)
-
-        def _get_tensor_name(param):
-            for i in range(len(all_params)):
-                if id(all_params[i]) == id(param):
-                    return all_names[i]
-            return None
+        clsname = type(method.__self__).__name__
 
         # get the parameter tensors used in the operation and the tensors specified by the developer
         oper_names, oper_params = self.__list_operating_params(method, *args, **kwargs)
-        user_names = self.getparamnames(method.__name__)
+        user_names = self.getparamnames(methodname)
         user_params = [get_attr(self, name) for name in user_names]
-        user_params_id = [id(p) for p in user_params]
-        oper_params_id = [id(p) for p in oper_params]
-        user_params_id_set = set(user_params_id)
-        oper_params_id_set = set(oper_params_id)
+        user_ids = frozenset(map(id, user_params))
+        oper_ids = frozenset(map(id, oper_params))
 
         # check if the userparams contains non-tensor
         for i in range(len(user_params)):
             param = user_params[i]
-            if (not isinstance(param, torch.Tensor)) or \
-               (isinstance(param, torch.Tensor) and param.dtype not in torch_float_type):
+            if not _is_float_tensor(param):
                 msg = "Parameter %s is a non-floating point tensor" % user_names[i]
                 raise GetSetParamsError(msg)
 
         # check if there are missing parameters (present in operating params, but not in the user params)
-        missing_names = []
-        for i in range(len(oper_names)):
-            if oper_params_id[i] not in user_params_id_set:
-                # if oper_names[i] not in user_names:
-                missing_names.append(oper_names[i])
+        # (all the names of a missing tensor are listed, including its aliases)
+        missing_names = [name for p, name in zip(oper_params, oper_names)
+                         if id(p) not in user_ids]
         # if there are missing parameters, give a warning (because the program
         # can still run correctly, e.g. missing parameters are parameters that
         # are never set to require grad)
@@ -274,11 +257,8 @@ class EditableModule(object):
             warnings.warn(msg, stacklevel=3)
 
         # check if there are excessive parameters (present in the user params, but not in the operating params)
-        excess_names = []
-        for i in range(len(user_names)):
-            if user_params_id[i] not in oper_params_id_set:
-                # if user_names[i] not in oper_names:
-                excess_names.append(user_names[i])
+        excess_names = [name for p, name in zip(user_params, user_names)
+                        if id(p) not in oper_ids]
         # if there are excess parameters, give warnings
         if len(excess_names) > 0:
             msg = "getparams for %s.%s has excess parameters: %s" % \
@@ -289,21 +269,24 @@ class EditableModule(object):
         # Sequence the tensors used in executing the method by calling the method
         # and see which parameters are connected in the backward graph
 
-        # get all the tensors recursively
-        all_tensors, all_names = _get_tensors(self)
+        # get all the tensors recursively as well as where they are stored
+        slots = []  # type: List[Tuple[Any, Any]]
+        all_tensors, all_names = _get_tensors(self, slots=slots)
 
         # copy the tensors and require them to be differentiable
-        copy_tensors0 = [tensor.clone().detach().requires_grad_() for tensor in all_tensors]
-        copy_tensors = copy.copy(copy_tensors0)
-        _set_tensors(self, copy_tensors)
+        copy_tensors = [tensor.detach().clone(memory_format=torch.preserve_format).requires_grad_()
+                        for tensor in all_tensors]
+        for (objdict, key), tensor in zip(slots, copy_tensors):
+            objdict[key] = tensor
 
         # run the method and see which one has the gradients
-        output = method(*args, **kwargs).sum()
-        grad_tensors = torch.autograd.grad(output, copy_tensors0, retain_graph=True, allow_unused=True)
-
-        # return the original tensor
-        all_tensors_copy = copy.copy(all_tensors)
-        _set_tensors(self, all_tensors_copy)
+        try:
+            output = method(*args, **kwargs).sum()
+            grad_tensors = torch.autograd.grad(output, copy_tensors, retain_graph=True, allow_unused=True)
+        finally:
+            # return the original tensor without traversing the object again
+            for (objdict, key), tensor in zip(slots, all_tensors):
+                objdict[key] = tensor
 
         names = []
         params = []
@@ -315,53 +298,143 @@ class EditableModule(object):
 
         return names, params
 
+def _is_inference(p: torch.Tensor) -> bool:
+    # inference tensors (torch>=1.9) do not track the version counter
+    return hasattr(p, "is_inference") and p.is_inference()
+
+def _tensor_signature(p: torch.Tensor):
+    # the memory of the tensor and its in-place modification counter
+    version = None if _is_inference(p) else p._version
+    return (p.data_ptr(), version, tuple(p.stride()))
+
+def _is_preserved(p0: torch.Tensor, sig0, p1: torch.Tensor) -> bool:
+    # check if p1 is the same as p0 before calling the method, where sig0 is
+    # the signature of p0 taken before calling the method
+    if p0.shape != p1.shape or p0.dtype != p1.dtype:
+        return False
+    if _is_inference(p0) or _is_inference(p1):
+        # in-place modifications cannot be tracked, so only compare the values
+        return torch.allclose(p0, p1)
+    sig1 = _tensor_signature(p1)
+    # the same memory that has not been modified in-place
+    if sig1 == sig0:
+        return True
+    # the original tensor (or its storage) has been modified in-place
+    if p0._version != sig0[1]:
+        return False
+    # the tensor is replaced, so compare the values with the unmodified original
+    return torch.allclose(p0, p1)
+
 ############################ traversing functions ############################
+def _is_float_tensor(elmt) -> bool:
+    return isinstance(elmt, torch.Tensor) and elmt.dtype in _TORCH_FLOAT_TYPES
+
+# Handlers of how to traverse down an object. A handler yields the name,
+# the container, the key, and the element for every element in the object.
+def _traverse_attrs(obj, prefix):
+    objdict = obj.__dict__
+    for key, elmt in objdict.items():
+        yield "%s%s" % (prefix, key), objdict, key, elmt
+
+def _traverse_mapping(obj, prefix):
+    for key, elmt in obj.items():
+        yield "%s[%s]" % (prefix, key), obj, key, elmt
+
+def _traverse_sequence(obj, prefix):
+    for key, elmt in enumerate(obj):
+        yield "%s[%s]" % (prefix, key), obj, key, elmt
+
+_NNMODULE_DICTS = ("_parameters", "_buffers", "_modules")
+
+def _traverse_nnmodule(obj, prefix):
+    # parameters, buffers, and submodules of torch.nn.Module are listed with
+    # their attribute names (e.g. "linear.weight") directly from the module's
+    # dictionaries, then the rest of the attributes are traversed as usual
+    objdict = obj.__dict__
+    for dctname in _NNMODULE_DICTS:
+        dct = objdict.get(dctname, None)
+        if dct is None:
+            continue
+        for key, elmt in dct.items():
+            if elmt is not None:
+                yield "%s%s" % (prefix, key), dct, key, elmt
+    for key, elmt in objdict.items():
+        if key not in _NNMODULE_DICTS:
+            yield "%s%s" % (prefix, key), objdict, key, elmt
+
+# handlers whose elements are accessed as attributes, i.e. with "." in the names
+_ATTR_HANDLERS = (_traverse_attrs, _traverse_nnmodule)
+
+# handler for every type, determined once for the type.
+# None means the object is not traversed.
+# The types are weakly referenced so the cache does not keep classes alive.
+_HANDLER_CACHE = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary[type, Optional[Callable]]
+
+def _get_traverse_handler(obj) -> Optional[Callable]:
+    objtype = type(obj)
+    try:
+        return _HANDLER_CACHE[objtype]
+    except KeyError:
+        pass
+
+    if objtype is torch.Tensor:
+        # non-floating point tensors do not contain other tensors
+        handler = None  # type: Optional[Callable]
+    elif isinstance(obj, torch.nn.Module):
+        handler = _traverse_nnmodule
+    elif hasattr(obj, "__dict__"):
+        handler = _traverse_attrs
+    elif hasattr(obj, "__iter__"):
+        handler = _traverse_mapping if isinstance(obj, dict) else _traverse_sequence
+    else:
+        handler = None
+    _HANDLER_CACHE[objtype] = handler
+    return handler
+
 def _traverse_obj(obj, prefix, action, crit, max_depth=20, exception_ids=None):
     """
     Traverse an object to get/set variables that are accessible through the object.
+    The traversal is depth-first, done with an explicit stack of the element
+    generators instead of recursive calls.
     """
     if exception_ids is None:
         # None is set as default arg to avoid expanding list for multiple
         # invokes of _get_tensors without exception_ids argument
         exception_ids = set()
 
-    if hasattr(obj, "__dict__"):
-        generator = obj.__dict__.items()
-        name_format = "{prefix}{key}"
-        objdict = obj.__dict__
-    elif hasattr(obj, "__iter__"):
-        generator = obj.items() if isinstance(obj, dict) else enumerate(obj)
-        name_format = "{prefix}[{key}]"
-        objdict = obj
-    else:
+    handler = _get_traverse_handler(obj)
+    if handler is None:
         raise RuntimeError("The object must be iterable or keyable")
 
-    for key, elmt in generator:
-        name = name_format.format(prefix=prefix, key=key)
+    # each entry: (generator of the elements, max_depth)
+    stack = [(handler(obj, prefix), max_depth)]
+    while stack:
+        generator, depth = stack[-1]
+        try:
+            name, objdict, key, elmt = next(generator)
+        except StopIteration:
+            stack.pop()
+            continue
+
         if crit(elmt):
             action(elmt, name, objdict, key)
             continue
 
-        hasdict = hasattr(elmt, "__dict__")
-        hasiter = hasattr(elmt, "__iter__")
-        if hasdict or hasiter:
+        elmt_handler = _get_traverse_handler(elmt)
+        if elmt_handler is not None:
             # add exception to avoid infinite loop if there is a mutual dependant on objects
             if id(elmt) in exception_ids:
                 continue
             else:
                 exception_ids.add(id(elmt))
 
-            if max_depth > 0:
-                _traverse_obj(elmt,
-                              action=action,
-                              crit=crit,
-                              prefix=name + "." if hasdict else name,
-                              max_depth=max_depth - 1,
-                              exception_ids=exception_ids)
+            if depth > 0:
+                elmt_prefix = name + "." if elmt_handler in _ATTR_HANDLERS else name
+                stack.append((elmt_handler(elmt, elmt_prefix), depth - 1))
             else:
                 raise RecursionError("Maximum number of recursion reached")
 
-def _get_tensors(obj, prefix="", max_depth=20):
+def _get_tensors(obj, prefix="", max_depth=20, slots=None):
     """
     Collect all tensors in an object recursively and return the tensors as well
     as their "names" (names meaning the address, e.g. "self.a[0].elmt").
@@ -372,6 +445,9 @@ def _get_tensors(obj, prefix="", max_depth=20):
         The object user wants to traverse down
     * prefix: str
         Prefix of the name of the collected tensors. Default: ""
+    * slots: list or None
+        If given, the ``(container, key)`` where each tensor is stored is
+        appended to this list. Default: None
 
     Returns
     -------
@@ -388,28 +464,9 @@ def _get_tensors(obj, prefix="", max_depth=20):
     def action(elmt, name, objdict, key):
         res.append(elmt)
         names.append(name)
+        if slots is not None:
+            slots.append((objdict, key))
 
     # traverse down the object to collect the tensors
-    crit = lambda elmt: isinstance(elmt, torch.Tensor) and elmt.dtype in torch_float_type
-    _traverse_obj(obj, action=action, crit=crit, prefix=prefix, max_depth=max_depth)
+    _traverse_obj(obj, action=action, crit=_is_float_tensor, prefix=prefix, max_depth=max_depth)
     return res, names
-
-def _set_tensors(obj, all_params, max_depth=20):
-    """
-    Set the tensors in an object to new tensor object listed in `all_params`.
-
-    Arguments
-    ---------
-    * obj: an instance
-        The object user wants to traverse down
-    * all_params: list of torch.Tensor
-        Sequence of tensors to be put in the object.
-    * max_depth: int
-        Maximum recursive depth to avoid infinitely running program.
-        If the maximum depth is reached, then raise a RecursionError.
-    """
-    def action(elmt, name, objdict, key):
-        objdict[key] = all_params.pop(0)
-    # traverse down the object to collect the tensors
-    crit = lambda elmt: isinstance(elmt, torch.Tensor) and elmt.dtype in torch_float_type
-    _traverse_obj(obj, action=action, crit=crit, prefix="", max_depth=max_depth)
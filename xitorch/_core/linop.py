@@ -8,6 +8,7 @@ from scipy.sparse.linalg import LinearOperator as spLinearOperator
 from xitorch._core.editable_module import EditableModule
 from xitorch.debug.modes import is_debug_enabled
 from xitorch._utils.bcast import get_bcasted_dims
+from xitorch._utils.misc import check_identical_objs
 
 __all__ = ["LinearOperator"]
 
@@ -184,12 +185,16 @@ class LinearOperator(EditableModule):
     @contextmanager
     def uselinopparams(self, *params):
         methodname = "mm"
+        _orig_params_ = self.getuniqueparams(methodname)
+        # skip setting and restoring if the parameters are the same tensors
+        identical = check_identical_objs(params, _orig_params_)
         try:
-            _orig_params_ = self.getuniqueparams(methodname)
-            self.setuniqueparams(methodname, *params)
+            if not identical:
+                self.setuniqueparams(methodname, *params)
             yield self
         finally:
-            self.setuniqueparams(methodname, *_orig_params_)
+            if not identical:
+                self.setuniqueparams(methodname, *_orig_params_)
 
     ############# implemented functions ################
     def mv(self, x: torch.Tensor) -> torch.Tensor:
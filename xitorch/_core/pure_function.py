@@ -3,6 +3,7 @@ import inspect
 from typing import Callable, List, Tuple, Union, Sequence
 from xitorch._utils.attr import set_attr, del_attr
 from xitorch._utils.unique import Uniquifier
+from xitorch._utils.misc import check_identical_objs
 from xitorch._core.editable_module import EditableModule
 from contextlib import contextmanager
 from abc import abstractmethod
@@ -46,7 +47,7 @@ class PureFunction(object):
 
     def set_objparams(self, objparams: List):
         # TODO: check if identical with current object parameters
-        identical = _check_identical_objs(objparams, self._cur_objparams)
+        identical = check_identical_objs(objparams, self._cur_objparams)
         self._restore_stack.append((self._cur_objparams, identical))
         if not identical:
             allobjparams = self._uniq.map_unique_objs(objparams)
@@ -152,12 +153,6 @@ class MultiSiblingPureFunction(PureFunction):
         for i, pfunc in enumerate(self.pfuncs):
             pfunc._set_all_obj_params(allobjparams[self.cumsum_idx[i]:self.cumsum_idx[i + 1]])
 
-def _check_identical_objs(objs1: List, objs2: List) -> bool:
-    for obj1, obj2 in zip(objs1, objs2):
-        if id(obj1) != id(obj2):
-            return False
-    return True
-
 def get_pure_function(fcn) -> PureFunction:
     """
     Get the pure function form of the function or method ``fcn``.
@@ -1,7 +1,10 @@
+import gc
+import pickle
+import weakref
 import torch
 import pytest
 from typing import List
-from xitorch._core.editable_module import EditableModule
+from xitorch._core.editable_module import EditableModule, _get_tensors
 from xitorch._core.pure_function import get_pure_function
 from xitorch._utils.exceptions import GetSetParamsError
 
@@ -23,6 +26,7 @@ class ModuleTest(EditableModule):
             2: a + 2.,
         }
         self.listparams = [a + 0.12, a + 2., a + 4]
+        self.zerosum = torch.tensor([1., -1.]) * a
 
     def method_no_preserve1(self, b: torch.Tensor) -> torch.Tensor:
         # this method changes a parameter
@@ -34,6 +38,16 @@ class ModuleTest(EditableModule):
         self.b = b
         return self.b * 2.0
 
+    def method_no_preserve3(self, b: torch.Tensor) -> torch.Tensor:
+        # this method permutes a parameter in-place
+        self.zerosum.copy_(self.zerosum.flip(0))
+        return self._dummy_fcn(b)
+
+    def method_no_preserve4(self, b: torch.Tensor) -> torch.Tensor:
+        # this method scales a parameter in-place without changing its sum
+        self.zerosum.mul_(3.)
+        return self._dummy_fcn(b)
+
     def method_dict_correct(self, b: torch.Tensor) -> torch.Tensor:
         return self._dummy_fcn(b) + self.dctparams[0] + self.dctparams[2]
 
@@ -85,6 +99,8 @@ class ModuleTest(EditableModule):
             return [prefix + "a"]
         elif methodname == "method_no_preserve1":
             return []
+        elif methodname in ["method_no_preserve3", "method_no_preserve4"]:
+            return [prefix + "a", prefix + "c", prefix + "d", prefix + "e"]
 
         elif methodname == "method_dict_correct":
             return [prefix + "a", prefix + "c", prefix + "d", prefix + "e",
@@ -156,6 +172,8 @@ def test_error_getsetparams():
     error_methods = [
         "method_no_preserve1",
         "method_no_preserve2",
+        "method_no_preserve3",
+        "method_no_preserve4",
         "method_nontensor_getparams",
     ]
     for methodname in error_methods:
@@ -166,6 +184,25 @@ def test_error_getsetparams():
         except GetSetParamsError:
             pass
 
+@pytest.mark.skipif(not hasattr(torch, "inference_mode"), reason="torch.inference_mode is not available")
+@pytest.mark.filterwarnings("error")
+def test_inference_tensors():
+    # inference tensors do not track the in-place modifications
+    with torch.inference_mode():
+        module = ModuleTest(torch.tensor([1.]))
+    module.assertparams(module.method_correct_getsetparams, b)
+
+    # replacing an inference tensor with different values is still detected
+    class ReplacingModule(ModuleTest):
+        def method_replace(self, b: torch.Tensor) -> torch.Tensor:
+            self.c = self.c + 1.
+            return self._dummy_fcn(b)
+
+    with torch.inference_mode():
+        module = ReplacingModule(torch.tensor([1.]))
+    with pytest.raises(GetSetParamsError):
+        module.assertparams(module.method_replace, b)
+
 def test_warning_getsetparams():
     warning_methods = [
         "method_missing_getparams",
@@ -179,6 +216,78 @@ def test_warning_getsetparams():
         with pytest.warns(UserWarning):
             model.assertparams(getattr(model, methodname), b)
 
+def test_getuniqueparams_pickle():
+    module = ModuleTest(torch.tensor([1.]))
+    methodname = "method_duplicate_correct"
+    params = module.getuniqueparams(methodname)
+    module2 = pickle.loads(pickle.dumps(module))
+    params2 = module2.getuniqueparams(methodname)
+    assert len(params2) == len(params)
+    for p, p2 in zip(params, params2):
+        assert torch.allclose(p, p2)
+
+def test_get_tensors_slots():
+    module = ModuleTest(torch.tensor([1.]))
+    slots = []
+    params, names = _get_tensors(module, slots=slots)
+    assert len(slots) == len(params)
+    # the slots are the containers and keys where the tensors are stored
+    for (objdict, key), param in zip(slots, params):
+        assert objdict[key] is param
+    objdict, key = slots[names.index("dctparams[2]")]
+    assert objdict is module.dctparams and key == 2
+
+def test_restore_tensors_on_error():
+    class RaisingModule(ModuleTest):
+        def method_raise(self, b: torch.Tensor) -> torch.Tensor:
+            # raises when running with the differentiable copies of the tensors
+            if self.a.requires_grad:
+                raise ValueError("intentional error")
+            return self._dummy_fcn(b)
+
+    module = RaisingModule(torch.tensor([1.]))
+    params0, names0 = _get_tensors(module)
+    with pytest.raises(ValueError):
+        module.assertparams(module.method_raise, b)
+    params1, names1 = _get_tensors(module)
+    assert names0 == names1
+    assert all(p0 is p1 for p0, p1 in zip(params0, params1))
+
+def test_get_tensors_nnmodule():
+    class ModuleWithNN(EditableModule):
+        def __init__(self):
+            self.net = torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.BatchNorm1d(3))
+            self.a = torch.tensor([1.])
+
+        def getparamnames(self, methodname: str, prefix: str = "") -> List[str]:
+            raise KeyError()
+
+    module = ModuleWithNN()
+    params, names = _get_tensors(module)
+    assert names == ["net.0.weight", "net.0.bias", "net.1.weight", "net.1.bias",
+                     "net.1.running_mean", "net.1.running_var", "a"]
+    assert params[0] is module.net[0].weight
+
+def test_traverse_handler_cache_weak():
+    class LocalModule(ModuleTest):
+        pass
+
+    _get_tensors(LocalModule(torch.tensor([1.])))
+    clsref = weakref.ref(LocalModule)
+    del LocalModule
+    gc.collect()
+    assert clsref() is None
+
+def test_setuniqueparams():
+    module = ModuleTest(torch.tensor([1.]))
+    methodname = "method_duplicate_correct"
+    params0 = module.getuniqueparams(methodname)
+    newparams = [torch.tensor([2.]) for _ in params0]
+    module.setuniqueparams(methodname, *newparams)
+    # duplicated parameters are set to the same tensor
+    assert module.a is newparams[0]
+    assert module.aa is newparams[0]
+
 ##############
 # test the wrap function to make it a functional
 def test_edit_simple():
@@ -1,4 +1,5 @@
 import warnings
+import pickle
 import torch
 from xitorch import LinearOperator
 from xitorch.linalg import solve
@@ -175,6 +176,39 @@ def test_linop2_rmm():
     ymm = linop.rmm(rx)
     assert torch.allclose(ymm, torch.matmul(mat.transpose(-2, -1), rx))
 
+def test_linop_uselinopparams():
+    class CountingLinOp(BaseLinOp):
+        nset = 0
+
+        def _mv(self, x):
+            return torch.matmul(self.mat, x.unsqueeze(-1)).squeeze(-1)
+
+        def setparams(self, methodname, *params):
+            self.nset += 1
+            return super(CountingLinOp, self).setparams(methodname, *params)
+
+    mat = torch.randn(3, 3)
+    linop = CountingLinOp(mat)
+
+    # using the same parameters does not set nor restore them
+    with linop.uselinopparams(mat):
+        assert linop.mat is mat
+    assert linop.nset == 0
+
+    # different parameters are set and then restored
+    mat2 = torch.randn(3, 3)
+    with linop.uselinopparams(mat2):
+        assert linop.mat is mat2
+    assert linop.mat is mat
+    assert linop.nset == 2
+
+def test_linop_pickle():
+    linop = LinearOperator.m(torch.randn(3, 3))
+    params = linop.getlinopparams()
+    assert len(params) == 1
+    linop2 = pickle.loads(pickle.dumps(linop))
+    assert torch.allclose(linop2.getlinopparams()[0], params[0])
+
 def test_linop_repr():
     dtype = torch.float32
     device = torch.device("cpu")
@@ -1,6 +1,6 @@
 import contextlib
 import torch
-from typing import Mapping, Callable, Union, Dict, List
+from typing import Mapping, Callable, Union, Dict, List, Sequence
 
 def set_default_option(defopt: Dict, opt: Dict) -> Dict:
     defopt.update(opt)
@@ -32,6 +32,11 @@ def get_method(
     else:
         raise TypeError("Invalid method type: %s. Only str and callable are accepted." % type(method))
 
+def check_identical_objs(objs1: Sequence, objs2: Sequence) -> bool:
+    # returns True if both sequences contain the same objects (not only equal).
+    # Comparing the lists of ids is done in C instead of a Python loop.
+    return list(map(id, objs1)) == list(map(id, objs2))
+
 @contextlib.contextmanager
 def dummy_context_manager():
     yield None
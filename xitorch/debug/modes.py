@@ -35,22 +35,18 @@ def is_debug_enabled():
 
 @contextmanager
 def enable_debug():
+    dbg_mode = is_debug_enabled()
     try:
-        dbg_mode = is_debug_enabled()
         set_debug_mode(True)
         yield
-    except Exception as e:
-        raise e
     finally:
         set_debug_mode(dbg_mode)
 
 @contextmanager
 def disable_debug():
+    dbg_mode = is_debug_enabled()
     try:
-        dbg_mode = is_debug_enabled()
         set_debug_mode(False)
         yield
-    except Exception as e:
-        raise e
     finally:
         set_debug_mode(dbg_mode)